@@ -1,12 +1,19 @@
+import csv
+import hashlib
 import io
-import sqlite3
+import os
+import re
 from pathlib import Path
 import tempfile
+import time
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from pandas.api.types import union_categoricals
 import streamlit as st
-import plotly.express as px
-from datetime import datetime, timedelta, date
+import plotly.graph_objects as go
+from datetime import datetime, date
 
 # =============================
 # Streamlit page configuration
@@ -60,6 +67,13 @@ ERROR_COLOR = "#FFABAB"     # vermelho claro (erros)
 PARTIAL_COLOR = "#FFFDB8"   # amarelo claro (integrado parcial)
 NEUTRAL_COLOR = "#f2f2f2"
 
+# Heurística de status de erro: contém erro/error/fail/integrado_parcial ou é exatamente NOK/falha/failed
+ERROR_PATTERN = r"erro|error|fail|integrado_parcial|^(?:nok|falha|failed)$"
+ERROR_RE = re.compile(ERROR_PATTERN)
+
+# Vírgula decimal nos percentuais dos KPIs (ver fmt_pct)
+DECIMAL_COMMA = str.maketrans({".": ","})
+
 # CSS para caixas KPI (inserido uma única vez)
 st.markdown(
     f"""
@@ -90,88 +104,286 @@ st.markdown(
 # =============================
 # Configuração de persistência
 # =============================
-DB_PATH = Path("integracoes.db")
-
-
-def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS integracoes (
-                status TEXT NOT NULL,
-                data_integracao TEXT NOT NULL,
-                tipo TEXT NOT NULL,
-                qtd INTEGER NOT NULL,
-                PRIMARY KEY (status, data_integracao, tipo)
-            )
-            """
-        )
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_integracoes_data ON integracoes(data_integracao)")
-        conn.commit()
+DATA_PATH = Path("integracoes.parquet")
+# Maior janela exibida pelo dashboard; linhas mais antigas são descartadas na carga
+MAX_WINDOW_DAYS = 30
+# Tipos esperados no CSV, aplicados já no parse (pyarrow/C; evita reinferência e conversões
+# posteriores). No parse em blocos, qtd fica de fora (ver _parse_csv)
+CSV_DTYPES = {"qtd": "Int64", "status": "category", "tipo": "category", "parent_type": "category"}
+# Máximo de entradas dos caches derivados da base (um DataFrame ou agregado por versão e
+# seleção de erros) e dos CSVs de download (várias tabelas por versão)
+DATA_CACHE_ENTRIES = 8
+DOWNLOAD_CACHE_ENTRIES = 32
+# Máximo de figuras Plotly mantidas em cache (ver status_figure / errors_figure)
+FIGURE_CACHE_ENTRIES = 64
+# Parses de CSV já feitos, em Parquet, por hash do conteúdo (sobrevivem a reinícios do app).
+# PARSE_CACHE_VERSION entra no nome do arquivo: incremente ao mudar o resultado do parse
+# (_parse_csv / _normalize_csv_frame / normalize_status) para não reaproveitar arquivos antigos.
+PARSE_CACHE_DIR = Path(tempfile.gettempdir()) / "integration-metrics-app" / "parse-cache"
+PARSE_CACHE_VERSION = 4
+PARSE_CACHE_MAX_FILES = 8
+PARSE_CACHE_TMP_MAX_AGE = 3600
+# Uploads acima de CSV_CHUNK_BYTES são lidos em blocos de CSV_CHUNK_ROWS linhas (ver _parse_csv)
+CSV_CHUNK_BYTES = 64 * 1024 * 1024
+CSV_CHUNK_ROWS = 200_000
+# Parsers tentados em ordem por _parse_csv (o pyarrow é o mais rápido; o C, o mais tolerante)
+CSV_ENGINES = ("pyarrow", "c")
+# Colunas textuais de baixa cardinalidade: como category, os groupby agrupam por códigos inteiros
+CATEGORY_COLUMNS = ("status", "tipo", "parent_type")
+STORED_COLUMNS = ["status", "dia", "tipo", "qtd"]
+# Ordem das linhas carregadas (ver _load_all_stored_cached); category ordena pelos códigos,
+# por isso to_categories mantém as categorias em ordem alfabética
+RAW_SORT_COLUMNS = ["dia", "status", "tipo"]
+# Dtypes compactos das colunas numéricas/datas (ver _normalize_csv_frame e to_day)
+STORED_DTYPES = {"dia": "datetime64[s]", "qtd": "int32"}
 
 
 def persist_df(df_csv: pd.DataFrame):
-    """Substitui completamente o conteúdo da tabela pelos dados do CSV (truncate + insert).
+    """Substitui completamente os dados armazenados pelos dados do CSV.
     Caso o CSV tenha múltiplas linhas com a mesma combinação (status, data_integracao, tipo),
-    os valores de qtd são agregados (soma) para evitar violação de PK.
+    os valores de qtd são agregados (soma), mantendo uma linha por combinação.
     Retorna (linhas_inseridas, linhas_agrupadas_originalmente).
     """
-    # Normaliza datas mesmo se vazio, para garantir consistência
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        # Limpa base antes de inserir novos dados
-        cur.execute("DELETE FROM integracoes")
-        if df_csv.empty:
-            conn.commit()
-            return 0, 0
-        rows = df_csv[["status", "data_integracao", "tipo", "qtd"]].copy()
-        rows["data_integracao"] = pd.to_datetime(rows["data_integracao"]).dt.strftime("%Y-%m-%d")
-        original_count = len(rows)
-        # Agrega duplicados
-        rows = (
-            rows.groupby(["status", "data_integracao", "tipo"], as_index=False)["qtd"].sum()
-        )
-        data = list(rows.itertuples(index=False, name=None))
-        cur.executemany(
-            """
-            INSERT INTO integracoes (status, data_integracao, tipo, qtd)
-            VALUES (?, ?, ?, ?)
-            """,
-            data,
-        )
-        conn.commit()
-        return len(data), original_count
+    if df_csv.empty:
+        # Limpa a base
+        DATA_PATH.unlink(missing_ok=True)
+        return 0, 0
+    rows = df_csv[STORED_COLUMNS]
+    original_count = len(rows)
+    # Agrega duplicados (dia já vem truncado para a data em load_csv)
+    rows = (
+        rows.groupby(["status", "dia", "tipo"], as_index=False, observed=True, sort=False)["qtd"].sum()
+    )
+    write_parquet_atomic(rows, DATA_PATH)
+    return len(rows), original_count
 
 
-def load_all_from_db() -> pd.DataFrame:
-    if not DB_PATH.exists():
-        return pd.DataFrame(columns=["status", "data_integracao", "tipo", "qtd"])  # vazio
-    with sqlite3.connect(DB_PATH) as conn:
-        df_db = pd.read_sql_query(
-            "SELECT status, data_integracao, tipo, qtd FROM integracoes",
-            conn,
-        )
-    if df_db.empty:
-        return df_db
-    df_db["data_integracao"] = pd.to_datetime(df_db["data_integracao"], errors="coerce")
-    df_db = df_db.dropna(subset=["data_integracao"]).copy()
-    df_db["dia"] = df_db["data_integracao"].dt.date
-    return df_db
+def write_parquet_atomic(df: pd.DataFrame, path: Path):
+    """Grava o Parquet em um temporário exclusivo no mesmo diretório e troca pelo destino,
+    para que outra sessão nunca leia um arquivo pela metade. O nome único (mkstemp) evita que
+    duas sessões escrevendo ao mesmo tempo (threads do mesmo processo) compartilhem o .tmp."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        df.to_parquet(tmp_path, index=False, compression="zstd")
+        tmp_path.chmod(0o644)  # mkstemp cria com 0600
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def data_version() -> int:
+    """Identificador da versão da base (mtime do Parquet; 0 se não existir).
+    Muda a cada persist_df e serve de chave para os caches derivados da base."""
+    return DATA_PATH.stat().st_mtime_ns if DATA_PATH.exists() else 0
+
+
+def load_all_stored(version: int = None) -> pd.DataFrame:
+    """Carrega as linhas dos últimos MAX_WINDOW_DAYS dias (em relação ao último dia armazenado).
+    O resultado fica em cache até o arquivo mudar (ex.: após persist_df), então reruns
+    por interação com widgets não releem o Parquet."""
+    return _load_all_stored_cached(data_version() if version is None else version)
+
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES)
+def _load_all_stored_cached(mtime: int) -> pd.DataFrame:
+    if not DATA_PATH.exists():
+        df_stored = pd.DataFrame(columns=STORED_COLUMNS)  # vazio
+    else:
+        df_stored = pd.read_parquet(DATA_PATH, columns=STORED_COLUMNS)
+    if df_stored.empty:
+        # Mesmos dtypes da base com dados (status categórico; ver a sidebar)
+        return to_categories(df_stored.astype(STORED_DTYPES))
+    start = df_stored["dia"].max() - pd.Timedelta(days=MAX_WINDOW_DAYS - 1)
+    # Parquet não tem unidade de segundos (volta como [ms]) e a soma em persist_df pode
+    # promover qtd; reaplica os mesmos dtypes de load_csv
+    df_stored = df_stored.loc[df_stored["dia"] >= start].astype(STORED_DTYPES)
+    df_stored = to_categories(df_stored)
+    # Bases gravadas antes da normalização de status em load_csv
+    df_stored["status"] = normalize_status(df_stored["status"])
+    # Ordenado por dia: as janelas viram fatias contíguas (ver window_slice); status e tipo
+    # em seguida, na ordem exibida em "Dados Brutos", que assim não reordena cada janela
+    return df_stored.sort_values(RAW_SORT_COLUMNS, kind="stable", ignore_index=True)
 
 # =============================
 # Helpers
 # =============================
-@st.cache_data(show_spinner=False)
+def to_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas de CATEGORY_COLUMNS presentes no DataFrame para o dtype category.
+    Categorias sem linhas (ex.: herdadas do Parquet antes do filtro de janela) são descartadas,
+    para que .cat.categories liste só valores presentes. As categorias ficam em ordem
+    alfabética: sort_values em coluna category ordena pelos códigos (ver RAW_SORT_COLUMNS)."""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            cat = df[col].astype("category").cat.remove_unused_categories()
+            if not cat.cat.categories.is_monotonic_increasing:
+                cat = cat.cat.reorder_categories(cat.cat.categories.sort_values())
+            df[col] = cat
+    return df
+
+
+def normalize_status(status: pd.Series) -> pd.Series:
+    """Status categórico com rótulos em minúsculas e sem espaços nas bordas.
+    Trabalha só nas categorias; rótulos que colidem após normalizar (ex.: "NOK" e "nok")
+    viram uma única categoria, remapeando os códigos. Categorias não textuais (ex.: códigos
+    200/500 inferidos como inteiros pelo parser) viram texto."""
+    cats = status.cat.categories
+    if cats.empty:
+        return status  # ex.: CSV só com cabeçalho
+    norm = cats.astype(str).str.strip().str.lower()
+    if norm.equals(cats):
+        return status
+    labels = pd.Index(norm.unique()).sort_values()  # ordem alfabética, como em to_categories
+    # Código novo de cada categoria antiga; -1 (NaN) continua -1
+    remap = np.append(labels.get_indexer(norm), -1)
+    codes = remap[status.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, labels), index=status.index, name=status.name)
+
+
+def parse_datetimes(values: pd.Series) -> pd.Series:
+    """Converte texto em datetime sem depender do formato do primeiro valor: ISO 8601 valor a
+    valor (aceita só data, data e hora, com ou sem fuso); o que não for ISO ainda é tentado
+    com format="mixed". Inválidos viram NaT."""
+    try:
+        dates = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    except ValueError:
+        # Valores com e sem fuso na mesma coluna: normaliza tudo para UTC
+        dates = pd.to_datetime(values, errors="coerce", format="ISO8601", utc=True)
+    bad = dates.isna() & values.notna()
+    if bad.any() and dates.dt.tz is None:
+        try:
+            dates[bad] = pd.to_datetime(values[bad], errors="coerce", format="mixed")
+        except (ValueError, TypeError):
+            pass  # ficam NaT
+    return dates
+
+
+def to_day(dates: pd.Series) -> pd.Series:
+    """Trunca datetimes para o dia. Usa datetime64[s], a menor unidade que o pandas suporta
+    (não há datetime64[D]); bem mais compacto que objetos date do Python.
+    Datas com fuso (ex.: ...T10:00:00Z) mantêm o dia local e perdem o fuso, como .dt.date."""
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.dt.floor("D").astype("datetime64[s]")
+
+
+def sniff_sep(file) -> str:
+    """Detecta o separador ("," ou ";") pelos primeiros 4 KB e volta o arquivo ao início."""
+    head = file.read(4096)
+    file.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", "ignore")
+    try:
+        return csv.Sniffer().sniff(head, delimiters=",;").delimiter
+    except csv.Error:
+        return ","
+
+
 def load_csv(file) -> pd.DataFrame:
+    """Lê o CSV enviado. O parse fica em cache pelo hash do conteúdo, então reenviar o mesmo
+    arquivo (inclusive em outra sessão ou após reiniciar o app) não refaz o parse."""
     if file is None:
         return pd.DataFrame()
-    # Tenta detectar separador automaticamente ("," ou ";")
+    raw = file.getvalue()
+    return _parse_csv_cached(content_key(raw), raw)
+
+
+def content_key(raw: bytes) -> str:
+    """Digest do conteúdo enviado: chave do parse em cache e do último upload persistido."""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+@st.cache_data(show_spinner=False)
+def _parse_csv_cached(key: str, _raw: bytes) -> pd.DataFrame:
+    # _raw não entra no hash do Streamlit (prefixo "_"); a chave é o digest do conteúdo.
+    # Fora do cache em memória, tenta o Parquet gravado por um parse anterior.
+    cache_path = PARSE_CACHE_DIR / f"v{PARSE_CACHE_VERSION}_{key}.parquet"
+    if cache_path.exists():
+        try:
+            # Parquet não tem unidade de segundos (dia volta como [ms])
+            df = pd.read_parquet(cache_path).astype(STORED_DTYPES)
+            cache_path.touch()  # mais recente para prune_parse_cache
+            return df
+        except Exception:
+            pass  # arquivo ilegível: refaz o parse e regrava
+    df = _parse_csv(_raw)
     try:
-        df = pd.read_csv(file, sep=None, engine="python")
-    except Exception:
-        file.seek(0)
-        df = pd.read_csv(file)
+        PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        write_parquet_atomic(df, cache_path)
+        prune_parse_cache()
+    except OSError:
+        pass  # o cache em disco é opcional (ex.: diretório sem permissão de escrita)
+    return df
+
+
+def prune_parse_cache():
+    """Mantém em PARSE_CACHE_DIR só os PARSE_CACHE_MAX_FILES parses mais recentes da versão
+    atual; arquivos de versões anteriores são removidos. Um .tmp só é removido depois de
+    PARSE_CACHE_TMP_MAX_AGE segundos: antes disso pode ser a escrita em curso de outra sessão."""
+    current = []
+    now = time.time()
+    for path in PARSE_CACHE_DIR.iterdir():
+        if path.suffix == ".tmp":
+            if now - path.stat().st_mtime > PARSE_CACHE_TMP_MAX_AGE:
+                path.unlink(missing_ok=True)
+        elif path.name.startswith(f"v{PARSE_CACHE_VERSION}_") and path.suffix == ".parquet":
+            current.append(path)
+        else:
+            path.unlink(missing_ok=True)
+    current.sort(key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for path in current[PARSE_CACHE_MAX_FILES:]:
+        path.unlink(missing_ok=True)
+
+
+def _parse_csv(raw: bytes) -> pd.DataFrame:
+    file = io.BytesIO(raw)
+    sep = sniff_sep(file)
+    # Arquivos grandes: parse em blocos (parser C), tipando e descartando data_integracao
+    # bloco a bloco, para não manter o frame cru inteiro em memória junto do tipado.
+    # Sem fallback para o parse do arquivo inteiro (justamente o que estouraria a memória):
+    # qtd fica fora do dtype para que um valor não numérico vire 0 em _normalize_csv_frame
+    # em vez de derrubar o bloco; outros erros de formato são reportados.
+    if len(raw) > CSV_CHUNK_BYTES:
+        chunks = pd.read_csv(
+            file,
+            sep=sep,
+            dtype={col: dtype for col, dtype in CSV_DTYPES.items() if col != "qtd"},
+            engine="c",
+            chunksize=CSV_CHUNK_ROWS,
+        )
+        return concat_frames([_normalize_csv_frame(chunk) for chunk in chunks])
+    # Parser do pyarrow (multithread) com separador detectado e tipos explícitos; se falhar,
+    # tenta o parser C e, por último, o Python (bem mais lento), ex.: cabeçalho fora do
+    # padrão ou qtd não numérica. Só o pyarrow converte as datas no parse (valor a valor);
+    # o parse_dates do C infere um formato a partir do primeiro valor e deixaria o resto
+    # como texto, então ali a conversão fica para parse_datetimes.
+    df = None
+    for engine in CSV_ENGINES:
+        try:
+            df = pd.read_csv(
+                file,
+                sep=sep,
+                dtype=CSV_DTYPES,
+                parse_dates=["data_integracao"] if engine == "pyarrow" else None,
+                engine=engine,
+            )
+            break
+        except Exception:
+            file.seek(0)
+    if df is None:
+        try:
+            df = pd.read_csv(file, sep=None, engine="python")
+        except Exception:
+            file.seek(0)
+            df = pd.read_csv(file)
+    return _normalize_csv_frame(df)
+
+
+def _normalize_csv_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Valida e tipa um frame lido do CSV (inteiro ou um bloco): qtd int32, dia, categorias.
+    Descarta data_integracao e as linhas sem data válida."""
     # Normaliza nomes de colunas
     df.columns = [c.strip().lower() for c in df.columns]
 
@@ -181,31 +393,70 @@ def load_csv(file) -> pd.DataFrame:
     if missing:
         raise ValueError(f"CSV não contém as colunas obrigatórias: {', '.join(sorted(missing))}")
 
-    # Converte tipos
-    df["qtd"] = pd.to_numeric(df["qtd"], errors="coerce").fillna(0).astype(int)
-    df["status"] = df["status"].astype(str)
-    df["tipo"] = df["tipo"].astype(str)
-    # Garantia de consistência: nada a fazer além das colunas obrigatórias
+    # Converte tipos (só o que o parser não entregou já tipado)
+    if pd.api.types.is_integer_dtype(df["qtd"]):
+        df["qtd"] = df["qtd"].fillna(0).astype("int32")
+    else:
+        df["qtd"] = pd.to_numeric(df["qtd"], errors="coerce", downcast="integer").fillna(0).astype("int32")
+    for col in ("status", "tipo"):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
 
     # data_integracao -> datetime (sem timezone)
-    df["data_integracao"] = pd.to_datetime(df["data_integracao"], errors="coerce")
-    df = df.dropna(subset=["data_integracao"]).copy()
-    # Apenas a data (para os agrupamentos por dia)
-    df["dia"] = df["data_integracao"].dt.date
-
-    return df
+    if not pd.api.types.is_datetime64_any_dtype(df["data_integracao"]):
+        df["data_integracao"] = parse_datetimes(df["data_integracao"])
+    # Apenas a data (para os agrupamentos por dia); data_integracao não é mais usada depois disso.
+    # Colunas derivadas antes de filtrar: o filtro final é a única cópia do frame (sem .copy()).
+    df["dia"] = to_day(df["data_integracao"])
+    df = to_categories(df)
+    df["status"] = normalize_status(df["status"])
+    columns = [c for c in df.columns if c != "data_integracao"]
+    return df.loc[df["dia"].notna(), columns]
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """Concatena frames com as mesmas colunas mantendo as colunas category: o pd.concat
+    convertê-las-ia para object quando as categorias diferem entre os blocos. As categorias
+    de cada bloco viram texto antes da união: um bloco com a coluna toda vazia tem categorias
+    de outro dtype (ex.: object vazio), o que o union_categoricals rejeita."""
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for col in frames[0].columns:
+        parts = [f[col] for f in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            parts = [p.cat.rename_categories(p.cat.categories.astype(str)) for p in parts]
+            columns[col] = union_categoricals(parts, sort_categories=True)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
 
 
-def is_error_status(s: str) -> bool:
+def is_error_status(s: str, error_set: frozenset = None) -> bool:
     s = (s or "").strip().lower()
-    # Heurística: marca como erro se contém palavras relacionadas ou for NOK/falha
-    return (
-        "erro" in s
-        or "error" in s
-        or "integrado_parcial" in s
-        or "fail" in s
-        or s in {"nok", "falha", "failed"}
-    )
+    # Status escolhidos pelo usuário na sidebar têm prioridade sobre a heurística
+    if error_set:
+        return s in error_set
+    # Heurística (ERROR_PATTERN): uma única busca da regex compilada
+    return ERROR_RE.search(s) is not None
+
+
+def error_mask(status: pd.Series, error_set: frozenset = None) -> pd.Series:
+    """Versão vetorizada de is_error_status: retorna um mask booleano para a coluna de status.
+    Se error_set for informado, considera erro apenas os status selecionados."""
+    if isinstance(status.dtype, pd.CategoricalDtype):
+        # Classifica só as categorias distintas e expande pelos códigos inteiros;
+        # código -1 (status ausente) cai no False acrescentado ao final.
+        cat_mask = error_mask(status.cat.categories.to_series(), error_set).to_numpy()
+        codes = status.cat.codes.to_numpy()
+        return pd.Series(np.append(cat_mask, False)[codes], index=status.index)
+    # string[pyarrow]: strip/lower/contains rodam nos kernels do Arrow, não em loops de str do Python
+    s = status.astype("string[pyarrow]").str.strip().str.lower()
+    if error_set:
+        mask = s.isin(error_set)
+    else:
+        mask = s.str.contains(ERROR_PATTERN, regex=True, na=False)
+    return mask.fillna(False).astype(bool)
 
 
 def _sanitize_pdf_text(text: str) -> str:
@@ -230,187 +481,321 @@ def _pdf_safe_multicell(pdf, w, h, text: str):
                 pass
 
 
-def window_mask(df: pd.DataFrame, max_day: date, days: int) -> pd.Series:
-    """Retorna um mask para últimos N dias (incluindo max_day). days=1 => somente max_day."""
-    start_day = max_day - timedelta(days=days - 1)
-    return (df["dia"] >= start_day) & (df["dia"] <= max_day)
+def window_start(max_day: date, days: int) -> np.datetime64:
+    """Primeiro dia da janela dos últimos N dias (incluindo max_day). days=1 => somente max_day."""
+    return np.datetime64(max_day, "D") - np.timedelta64(days - 1, "D")
+
+
+def window_slice(dias: np.ndarray, max_day: date, days: int) -> slice:
+    """Retorna a fatia posicional da janela dos últimos N dias sobre dias ORDENADOS.
+    Duas buscas binárias (O(log N)) no lugar de um mask booleano sobre a coluna inteira;
+    df.iloc[fatia] não copia os dados."""
+    lo = dias.searchsorted(window_start(max_day, days), side="left")
+    hi = dias.searchsorted(np.datetime64(max_day, "D") + np.timedelta64(1, "D"), side="left")
+    return slice(lo, hi)
+
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES)
+def kpi_by_window(
+    _df: pd.DataFrame, data_key: int, err_key: tuple, max_day: date, window_days: dict
+) -> dict:
+    """Retorna {janela: (total, erros)} a partir de um único groupby por (dia, is_error).
+    As janelas são aninhadas (Hoje ⊂ 7d ⊂ 30d), então cada uma é só a soma dos dias >= início
+    sobre o agregado, que tem no máximo 2 x 30 linhas. Em cache por versão da base e seleção
+    de erros: interações que não mudam nenhum dos dois não refazem o groupby."""
+    by_day = (
+        _df.groupby(["dia", "is_error"])["qtd"].sum()
+        .unstack(fill_value=0)
+        .reindex(columns=[False, True], fill_value=0)
+    )
+    totals = {}
+    for title, days in window_days.items():
+        window = by_day.loc[by_day.index >= window_start(max_day, days)]
+        erros = int(window[True].sum())
+        totals[title] = (int(window[False].sum()) + erros, erros)
+    return totals
 
 
-def kpi_row(df_window: pd.DataFrame):
-    total = int(df_window["qtd"].sum())
-    err_mask = df_window["status"].apply(is_error_status)
-    erros = int(df_window.loc[err_mask, "qtd"].sum())
-    sucesso = int(total - erros)
-    if total > 0:
-        sucesso_pct = sucesso / total * 100
-        erros_pct = erros / total * 100
-    else:
-        sucesso_pct = erros_pct = 0.0
-    c1, c2, c3 = st.columns(3)
-    c1.markdown(
-        f"""
-        <div class='kpi-box' style='background:{NEUTRAL_COLOR};'>
-            <div class='kpi-label'>Total</div>
-            <div class='kpi-value'>{total}</div>
-        </div>
-        """,
-        unsafe_allow_html=True,
+# As funções cacheadas abaixo recebem o DataFrame com prefixo "_" (o Streamlit não o
+# hasheia) e chaves explícitas (data_version(), err_key, window_key...) que identificam o
+# conteúdo sem percorrer o frame a cada rerun.
+#
+# Agregados diários sobre a base inteira (MAX_WINDOW_DAYS dias): as janelas menores são
+# fatias por dia desses agregados (ver window_rows), sem groupby por janela.
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES)
+def agg_by_status(_df: pd.DataFrame, data_key: int) -> pd.DataFrame:
+    """Agrega qtd por dia e status (ordenado por dia)."""
+    return (
+        _df.groupby(["dia", "status"], as_index=False, observed=True, sort=False)["qtd"].sum()
+        .sort_values(["dia", "status"], ignore_index=True)
     )
-    c2.markdown(
-        f"""
-        <div class='kpi-box' style='background:{SUCCESS_COLOR};'>
-            <div class='kpi-label'>Sucesso (est.)</div>
-            <div class='kpi-value'>{sucesso} <span class='kpi-badge-success'>{sucesso_pct:.1f}%</span></div>
-        </div>
-        """.replace('.', ','),
-        unsafe_allow_html=True,
+
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES)
+def agg_errors_by_tipo(_df: pd.DataFrame, data_key: int, err_key: tuple) -> pd.DataFrame:
+    """Agrega qtd de erros por dia e tipo (ordenado por dia).
+    Retorna DataFrame vazio se não houver erros."""
+    df_err = _df.loc[_df["is_error"], ["dia", "tipo", "qtd"]]
+    if df_err.empty:
+        return df_err
+    return (
+        df_err.groupby(["dia", "tipo"], as_index=False, observed=True, sort=False)["qtd"].sum()
+        .sort_values("dia", kind="stable", ignore_index=True)
     )
-    c3.markdown(
-        f"""
-        <div class='kpi-box' style='background:{ERROR_COLOR};'>
-            <div class='kpi-label'>Erros (est.)</div>
-            <div class='kpi-value'>{erros} <span class='kpi-badge-error'>{erros_pct:.1f}%</span></div>
-        </div>
-        """.replace('.', ','),
-        unsafe_allow_html=True,
+
+
+def window_rows(agg: pd.DataFrame, max_day: date, days: int) -> pd.DataFrame:
+    """Linhas de um agregado diário (ordenado por dia) que caem na janela dos últimos N dias."""
+    return agg.iloc[window_slice(agg["dia"].to_numpy(), max_day, days)]
+
+
+def rank_tipos(agg: pd.DataFrame, top_n: int = 8) -> list:
+    """Os top_n tipos com mais erros no agregado (em ordem decrescente de qtd)."""
+    return agg.groupby("tipo", observed=True, sort=False)["qtd"].sum().nlargest(top_n).index.tolist()
+
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_ENTRIES)
+def top_tipos_by_window(
+    _agg: pd.DataFrame, data_key: int, err_key: tuple, max_day: date, window_days: dict, top_n: int = 8
+) -> dict:
+    """{janela: top_n tipos com mais erros}, calculado uma vez por versão da base e seleção
+    de erros; _agg é o agregado diário de erros (agg_errors_by_tipo)."""
+    return {
+        title: rank_tipos(window_rows(_agg, max_day, days), top_n)
+        for title, days in window_days.items()
+    }
+
+
+def top_tipos(agg: pd.DataFrame, top_n: int = 8, top: list = None) -> pd.DataFrame:
+    """Restringe o agregado de erros da janela aos top_n tipos com mais erros.
+    top: ranking já calculado (ver top_tipos_by_window); se None, é calculado aqui."""
+    if agg.empty:
+        return agg
+    if top is None:
+        top = rank_tipos(agg, top_n)
+    return (
+        agg[agg["tipo"].isin(top)]
+        .sort_values(["dia", "qtd"], ascending=[True, False])
     )
 
 
-def chart_by_status(df_window: pd.DataFrame, title_suffix: str):
-    fig = build_chart_by_status(df_window, title_suffix)
-    st.plotly_chart(fig, use_container_width=True)
+@st.cache_data(show_spinner=False, max_entries=DOWNLOAD_CACHE_ENTRIES)
+def to_csv_bytes(_df: pd.DataFrame, cache_key: tuple, columns: list = None) -> bytes:
+    """CSV (UTF-8) para os botões de download. st.download_button recebe os bytes a cada
+    rerun, mesmo sem clique; com o cache, só a primeira renderização paga a serialização.
+    cache_key identifica o conteúdo (tabela, window_key e err_key, pois is_error e o
+    filtro de erros dependem da seleção). Usa o writer CSV do pyarrow (C++), bem mais rápido
+    que o DataFrame.to_csv. columns restringe as colunas exportadas (None = todas)."""
+    table = pa.Table.from_pandas(_df, columns=columns, preserve_index=False)
+    # dia vira date32 para sair como AAAA-MM-DD (timestamp sairia com " 00:00:00")
+    if "dia" in table.column_names:
+        i = table.column_names.index("dia")
+        table = table.set_column(i, "dia", table.column("dia").cast(pa.date32()))
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def fmt_pct(value: float) -> str:
+    """Percentual com uma casa e vírgula decimal (ex.: 45,5%). Só o número é traduzido,
+    não o HTML inteiro do KPI."""
+    return f"{value:.1f}%".translate(DECIMAL_COMMA)
+
+
+def bar_figure(
+    agg: pd.DataFrame,
+    color_col: str,
+    color_label: str,
+    title: str,
+    color_map: dict = None,
+    barmode: str = "relative",
+) -> go.Figure:
+    """Monta o gráfico de barras por dia com um go.Bar por valor de color_col, direto dos
+    arrays do agregado (sem a conversão DataFrame -> traces do Plotly Express)."""
+    color_map = color_map or {}
+    # Evita poluição visual se houver barras demais
+    show_text = len(agg) <= 120
+    fig = go.Figure()
+    for key, sub in agg.groupby(color_col, observed=True, sort=False):
+        qtd = sub["qtd"].to_numpy()
+        fig.add_bar(
+            x=sub["dia"].to_numpy(),
+            y=qtd,
+            name=str(key),
+            marker_color=color_map.get(key),
+            text=qtd if show_text else None,
+            texttemplate="%{text}",
+            textposition="outside" if show_text else "none",
+            cliponaxis=False,
+            hovertemplate=f"{color_label}={key}<br>Dia=%{{x}}<br>Quantidade=%{{y}}<extra></extra>",
+        )
+    fig.update_layout(
+        title=title,
+        barmode=barmode,
+        xaxis_title="Dia",
+        yaxis_title="Quantidade",
+        legend_title_text=color_label,
+    )
     return fig
 
 
-def build_chart_by_status(df_window: pd.DataFrame, title_suffix: str):
-    """Retorna fig Plotly de integrações por dia e status."""
-    agg = (
-        df_window.groupby(["dia", "status"], as_index=False)["qtd"].sum()
-        .sort_values("dia")
-    )
+def build_chart_by_status(agg: pd.DataFrame, title_suffix: str, error_set: frozenset = None):
+    """Retorna fig Plotly de integrações por dia e status.
+    agg são as linhas da janela no agregado diário (ver agg_by_status e window_rows)."""
     # Define cores desejadas: sucesso => verde, integrado_parcial => amarelo, erro => vermelho
     color_map = {}
     for s in agg["status"].unique():
         s_norm = str(s).lower()
         if "integrado_parcial" in s_norm:
             color_map[s] = PARTIAL_COLOR
-        elif is_error_status(s_norm):
+        elif is_error_status(s_norm, error_set):
             color_map[s] = ERROR_COLOR
         else:
             color_map[s] = SUCCESS_COLOR
-    fig = px.bar(
+    return bar_figure(
         agg,
-        x="dia",
-        y="qtd",
-        color="status",
-        text="qtd",
+        color_col="status",
+        color_label="Status",
         title=f"Integrações por dia e status — {title_suffix}",
-        labels={"dia": "Dia", "qtd": "Quantidade", "status": "Status"},
-        color_discrete_map=color_map,
+        color_map=color_map,
     )
-    fig.update_traces(
-        texttemplate="%{text}",
-        textposition="outside",
-        cliponaxis=False,
-    )
-    # Evita poluição visual se houver barras demais
-    if len(agg) > 120:
-        fig.update_traces(textposition="none")
-    # Ordena legenda: Sucessos primeiro (não erro), depois erros
-    ordered = sorted(agg["status"].unique(), key=lambda s: (is_error_status(str(s)), str(s)))
-    fig.update_layout(legend=dict(traceorder="normal"))
-    # Reforça ordem das categorias no eixo/legenda
-    fig.update_traces()
-    return fig
-
-
-def chart_errors_by_tipo(df_window: pd.DataFrame, title_suffix: str, top_n: int = 8):
-    fig, agg = build_chart_errors_by_tipo(df_window, title_suffix, top_n)
-    if fig is None:
-        st.info("Não há linhas de erro para este período.")
-        return None
-    st.plotly_chart(fig, use_container_width=True)
-    with st.expander("Ver tabela detalhada (erros por dia x tipo)"):
-        st.dataframe(agg, use_container_width=True)
-        csv = agg.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "Baixar CSV (erros por dia x tipo)",
-            data=csv,
-            file_name=f"erros_por_dia_tipo_{title_suffix.replace(' ', '_').lower()}.csv",
-            mime="text/csv",
-            key=f"dl_errors_{title_suffix.replace(' ', '_').lower()}"
-        )
-    return fig
 
 
-def build_chart_errors_by_tipo(df_window: pd.DataFrame, title_suffix: str, top_n: int = 8):
-    """Retorna (fig, agg) ou (None, None) se não houver erros."""
-    err_mask = df_window["status"].apply(is_error_status)
-    df_err = df_window.loc[err_mask].copy()
-    if df_err.empty:
+def build_chart_errors_by_tipo(agg: pd.DataFrame, title_suffix: str, top_n: int = 8, top: list = None):
+    """Retorna (fig, agg) ou (None, None) se não houver erros.
+    agg são as linhas da janela no agregado diário de erros (ver agg_errors_by_tipo)."""
+    agg = top_tipos(agg, top_n, top)
+    if agg.empty:
         return None, None
-    top = (
-        df_err.groupby("tipo")["qtd"].sum().nlargest(top_n).index.tolist()
-    )
-    df_top = df_err[df_err["tipo"].isin(top)]
-    agg = (
-        df_top.groupby(["dia", "tipo"], as_index=False)["qtd"].sum()
-        .sort_values(["dia", "qtd"], ascending=[True, False])
-    )
-    fig = px.bar(
+    fig = bar_figure(
         agg,
-        x="dia",
-        y="qtd",
-        color="tipo",
-        text="qtd",
-        barmode="group",
+        color_col="tipo",
+        color_label="Tipo",
         title=f"Erros por tipo ao longo do tempo — {title_suffix}",
-        labels={"dia": "Dia", "qtd": "Quantidade", "tipo": "Tipo"},
-    )
-    fig.update_traces(
-        texttemplate="%{text}",
-        textposition="outside",
-        cliponaxis=False,
+        barmode="group",
     )
-    if len(agg) > 120:
-        fig.update_traces(textposition="none")
     return fig, agg
 
 
+# Figuras prontas (com a escala Y já aplicada) compartilhadas entre reruns e sessões:
+# st.cache_resource devolve o mesmo objeto, sem reconstruir e revalidar os traces.
+# Por isso ninguém altera a figura depois (ex.: update_yaxes) — tudo entra na chave.
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def status_figure(_agg: pd.DataFrame, window_key: tuple, title_suffix: str, err_key: tuple, y_max: float):
+    fig = build_chart_by_status(_agg, title_suffix, frozenset(err_key))
+    if y_max > 0:
+        fig.update_yaxes(range=[0, y_max * 1.05])
+    return fig
+
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def errors_figure(
+    _agg: pd.DataFrame, window_key: tuple, title_suffix: str, err_key: tuple, top: list, y_max: float
+):
+    fig, _ = build_chart_errors_by_tipo(_agg, title_suffix, top=top)
+    if fig is not None and y_max > 0:
+        fig.update_yaxes(range=[0, y_max * 1.05])
+    return fig
+
+
+# Seções com botões de download ficam em fragments: um clique reexecuta só a seção,
+# sem refazer KPIs e gráficos do restante da página.
+@st.fragment
+def render_error_charts(error_figs: dict, window_keys: dict, err_key: tuple = ()):
+    cols_errors = st.columns(len(error_figs))
+    for (title, (fig, agg_err)), col in zip(error_figs.items(), cols_errors):
+        with col:
+            st.markdown(f"**{title}**")
+            if fig is None:
+                st.info("Sem erros.")
+                continue
+            st.plotly_chart(fig, use_container_width=True)
+            with st.expander("Tabela"):
+                st.dataframe(agg_err, use_container_width=True)
+                st.download_button(
+                    "Baixar CSV (erros)",
+                    data=to_csv_bytes(agg_err, ("erros", window_keys[title], err_key)),
+                    file_name=f"erros_{title.replace(' ', '_').lower()}.csv",
+                    mime="text/csv",
+                    key=f"dl_errors_compare_{title.replace(' ', '_').lower()}"
+                )
+
+
+@st.fragment
+def render_raw_windows(window_dfs: dict, window_keys: dict):
+    st.subheader("Dados Brutos por Janela")
+    cols_raw = st.columns(len(window_dfs))
+    for (title, df_win), col in zip(window_dfs.items(), cols_raw):
+        with col:
+            st.markdown(f"**{title}**")
+            if df_win.empty:
+                st.info("Sem dados.")
+                continue
+            # is_error é coluna interna (depende da seleção na sidebar): fica fora da tabela e
+            # do CSV, que assim não dependem de err_key. column_order evita copiar a janela.
+            columns = [c for c in df_win.columns if c != "is_error"]
+            # df_win já vem ordenado por RAW_SORT_COLUMNS (fatia da base ordenada na carga)
+            st.dataframe(df_win, column_order=columns, use_container_width=True, height=300)
+            st.download_button(
+                "Baixar CSV",
+                data=to_csv_bytes(df_win, ("dados", window_keys[title]), columns),
+                file_name=f"dados_{title.replace(' ', '_').lower()}.csv",
+                mime="text/csv",
+                key=f"dl_periodo_compare_{title.replace(' ', '_').lower()}"
+            )
+
+
 # =============================
 # Sidebar — Upload e opções
 # =============================
 uploaded = st.file_uploader("📤 Faça upload do CSV", type=["csv"]) 
 
-init_db()
-
 df: pd.DataFrame
 if uploaded is not None:
-    try:
-        df_upload = load_csv(uploaded)
-    except Exception as ex:
-        st.error(f"Falha ao carregar CSV: {ex}")
-        st.stop()
-    rows_inserted, original_rows = persist_df(df_upload)
-    df = load_all_from_db()
-    if rows_inserted:
+    # O arquivo continua no uploader a cada interação: só regrava a base quando chega um
+    # upload novo (file_id muda ao reenviar) com conteúdo novo. Regravar mudaria o mtime
+    # (data_version) e invalidaria todos os caches.
+    upload_key = (uploaded.file_id, content_key(uploaded.getvalue()))
+    persisted = st.session_state.get("persisted_upload")
+    if persisted is None or persisted[0] != upload_key:
+        try:
+            df_upload = load_csv(uploaded)
+        except Exception as ex:
+            st.error(f"Falha ao carregar CSV: {ex}")
+            st.stop()
+        result = persist_df(df_upload)
+        # Versão gravada por este upload: se mudar, outra sessão substituiu a base
+        persisted = (upload_key, data_version(), result)
+        st.session_state["persisted_upload"] = persisted
+    _, persisted_version, (rows_inserted, original_rows) = persisted
+    data_key = data_version()
+    df = load_all_stored(data_key)
+    if data_key != persisted_version:
+        st.info(
+            "A base foi substituída por outro upload depois do seu; exibindo os dados atuais. "
+            f"Registros nos últimos {MAX_WINDOW_DAYS} dias: {len(df)}. "
+            "Reenvie o arquivo para voltar a usá-lo."
+        )
+    elif rows_inserted:
         reducao = original_rows - rows_inserted
         agg_info = f" (agregadas {reducao} linhas duplicadas)" if reducao > 0 else ""
-        st.success(f"Upload processado: {rows_inserted} registros inseridos{agg_info}. Total atual: {len(df)}.")
+        st.success(f"Upload processado: {rows_inserted} registros inseridos{agg_info}. Registros nos últimos {MAX_WINDOW_DAYS} dias: {len(df)}.")
     else:
         st.warning("Base limpa. CSV sem registros válidos.")
 else:
-    df = load_all_from_db()
+    data_key = data_version()
+    df = load_all_stored(data_key)
     if df.empty:
         st.info("Nenhum dado armazenado ainda. Faça upload de um CSV para popular a base.")
         st.stop()
     else:
-        st.success(f"Usando dados já armazenados. Total atual: {len(df)} registros.")
+        st.success(f"Usando dados já armazenados. Registros nos últimos {MAX_WINDOW_DAYS} dias: {len(df)}.")
 
 # Permite ao usuário ajustar a detecção de erro (opcional)
 with st.sidebar:
     st.subheader("Configuração de status de erro (opcional)")
-    unique_status = sorted(df["status"].astype(str).str.strip().str.lower().unique())
+    # status já vem normalizado e categórico (normalize_status): basta ler as categorias
+    unique_status = sorted(df["status"].cat.categories)
     suggested_errors = [s for s in unique_status if is_error_status(s)]
     selected_errors = st.multiselect(
         "Quais status você considera como erro?",
@@ -418,11 +803,13 @@ with st.sidebar:
         default=suggested_errors,
     )
 
-# Se o usuário alterou os erros, reflete na função de máscara
-if selected_errors:
-    def is_error_status(s: str) -> bool:  # type: ignore[no-redef]
-        s = (s or "").strip().lower()
-        return s in set(selected_errors)
+# Seleção congelada uma vez por rerun; vazia => vale a heurística de is_error_status
+error_set = frozenset(selected_errors)
+
+# Classifica erro uma única vez para o dataset inteiro; as janelas apenas filtram a coluna
+df["is_error"] = error_mask(df["status"], error_set)
+# Ordenada: reordenar a seleção na sidebar não invalida os caches que dependem dela
+err_key = tuple(sorted(error_set))
 
 # =============================
 # Janelas de tempo
@@ -431,26 +818,38 @@ max_day = df["dia"].max() if not df.empty else None
 if pd.isna(max_day):
     st.warning("Dataset sem datas válidas em data_integracao.")
     st.stop()
+max_day = max_day.date()
 
-st.success(f"Data de referência (último dia armazenado no SQLite): **{max_day}**")
+st.success(f"Data de referência (último dia armazenado): **{max_day}**")
 
 label_hoje = str(max_day)  # mostra a própria data (ISO) em vez de 'Hoje'
-masks = {
-    label_hoje: window_mask(df, max_day, days=1),
-    "Últimos 7 dias": window_mask(df, max_day, days=7),
-    "Últimos 30 dias": window_mask(df, max_day, days=30),
+window_days = {
+    label_hoje: 1,
+    "Últimos 7 dias": 7,
+    "Últimos 30 dias": MAX_WINDOW_DAYS,
 }
+# df vem ordenado por dia (load_all_stored): cada janela é uma fatia contígua
+dias = df["dia"].to_numpy()
+slices = {title: window_slice(dias, max_day, days) for title, days in window_days.items()}
+# Chave de cache de cada janela: versão da base + tamanho da janela (o max_day é
+# função da versão). Evita hashear os DataFrames nas funções cacheadas.
+window_keys = {title: (data_key, days) for title, days in window_days.items()}
+
+# Um único groupby sobre os 30 dias para cada gráfico; as janelas fatiam o resultado
+daily_status = agg_by_status(df, data_key)
+daily_errors = agg_errors_by_tipo(df, data_key, err_key)
 
 ###############################
 # Layout comparativo (lado a lado)
 ###############################
 st.header("Comparativo entre janelas de tempo")
 
-# Pré-calcula dataframes por janela
-window_dfs = {title: df.loc[mask].copy() for title, mask in masks.items()}
+# Pré-calcula dataframes por janela (somente leitura, por isso sem .copy())
+window_dfs = {title: df.iloc[sl] for title, sl in slices.items()}
 
 # Linha de KPIs (cada janela em uma coluna)
 st.subheader("KPIs")
+kpis = kpi_by_window(df, data_key, err_key, max_day, window_days)
 cols = st.columns(len(window_dfs))
 for (title, df_win), col in zip(window_dfs.items(), cols):
     with col:
@@ -458,8 +857,7 @@ for (title, df_win), col in zip(window_dfs.items(), cols):
         if df_win.empty:
             st.info("Sem dados.")
             continue
-        total = int(df_win["qtd"].sum())
-        erros = int(df_win.loc[df_win["status"].apply(is_error_status), "qtd"].sum())
+        total, erros = kpis[title]
         sucesso = total - erros
         if total > 0:
             sucesso_pct = sucesso / total * 100
@@ -479,93 +877,63 @@ for (title, df_win), col in zip(window_dfs.items(), cols):
             f"""
             <div class='kpi-box' style='background:{SUCCESS_COLOR};'>
                 <div class='kpi-label'>Sucesso</div>
-                <div class='kpi-value'>{sucesso} <span class='kpi-badge-success'>{sucesso_pct:.1f}%</span></div>
+                <div class='kpi-value'>{sucesso} <span class='kpi-badge-success'>{fmt_pct(sucesso_pct)}</span></div>
             </div>
-            """.replace('.', ','),
+            """,
             unsafe_allow_html=True,
         )
         st.markdown(
             f"""
             <div class='kpi-box' style='background:{ERROR_COLOR};'>
                 <div class='kpi-label'>Erros</div>
-                <div class='kpi-value'>{erros} <span class='kpi-badge-error'>{erros_pct:.1f}%</span></div>
+                <div class='kpi-value'>{erros} <span class='kpi-badge-error'>{fmt_pct(erros_pct)}</span></div>
             </div>
-            """.replace('.', ','),
+            """,
             unsafe_allow_html=True,
         )
 
 # Linha de gráficos por status
 st.subheader("Gráficos por Status")
 cols_status = st.columns(len(window_dfs))
-# Para tentar comparação mais justa, mesma escala Y se possível
-max_status_y = 0
+# Para tentar comparação mais justa, mesma escala Y se possível. As janelas são fatias
+# de daily_status, que cobre a maior delas: o máximo geral é o próprio máximo do agregado.
+max_status_y = daily_status["qtd"].max() if not daily_status.empty else 0
 status_figs = {}
-for title, df_win in window_dfs.items():
-    if not df_win.empty:
-        agg_tmp = df_win.groupby(["dia", "status"], as_index=False)["qtd"].sum()
-        if not agg_tmp.empty:
-            max_status_y = max(max_status_y, agg_tmp["qtd"].max())
+status_aggs = {title: window_rows(daily_status, max_day, days) for title, days in window_days.items()}
 for (title, df_win), col in zip(window_dfs.items(), cols_status):
     with col:
         st.markdown(f"**{title}**")
         if df_win.empty:
             st.info("Sem dados.")
             continue
-        fig = build_chart_by_status(df_win, title)
-        if max_status_y > 0:
-            fig.update_yaxes(range=[0, max_status_y * 1.05])
+        fig = status_figure(status_aggs[title], window_keys[title], title, err_key, float(max_status_y))
         st.plotly_chart(fig, use_container_width=True)
         status_figs[title] = fig
 
 # Linha de gráficos de erros por tipo
 st.subheader("Gráficos de Erros por Tipo ")
-cols_errors = st.columns(len(window_dfs))
 max_errors_y = 0
-error_figs = {}
-for title, df_win in window_dfs.items():
-    if not df_win.empty:
-        err_fig, agg_err = build_chart_errors_by_tipo(df_win, title)
-        if err_fig is not None and agg_err is not None and not agg_err.empty:
+error_aggs = {}
+top_by_window = top_tipos_by_window(daily_errors, data_key, err_key, max_day, window_days)
+for title, days in window_days.items():
+    if not window_dfs[title].empty:
+        agg_err = top_tipos(window_rows(daily_errors, max_day, days), top=top_by_window[title])
+        if not agg_err.empty:
             max_errors_y = max(max_errors_y, agg_err["qtd"].max())
-        error_figs[title] = (err_fig, agg_err)
-for (title, (fig, agg_err)), col in zip(error_figs.items(), cols_errors):
-    with col:
-        st.markdown(f"**{title}**")
-        if fig is None:
-            st.info("Sem erros.")
-            continue
-        if max_errors_y > 0:
-            fig.update_yaxes(range=[0, max_errors_y * 1.05])
-        st.plotly_chart(fig, use_container_width=True)
-        with st.expander("Tabela"):
-            st.dataframe(agg_err, use_container_width=True)
-            csv_err = agg_err.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Baixar CSV (erros)",
-                data=csv_err,
-                file_name=f"erros_{title.replace(' ', '_').lower()}.csv",
-                mime="text/csv",
-                key=f"dl_errors_compare_{title.replace(' ', '_').lower()}"
-            )
+        error_aggs[title] = agg_err
+error_figs = {}
+for title, agg_err in error_aggs.items():
+    if agg_err.empty:
+        error_figs[title] = (None, None)
+        continue
+    err_fig = errors_figure(
+        agg_err, window_keys[title], title, err_key, top_by_window[title], float(max_errors_y)
+    )
+    error_figs[title] = (err_fig, agg_err)
+render_error_charts(error_figs, window_keys, err_key)
 
 # Dados brutos comparativos (opcional)
-st.subheader("Dados Brutos por Janela")
-cols_raw = st.columns(len(window_dfs))
-for (title, df_win), col in zip(window_dfs.items(), cols_raw):
-    with col:
-        st.markdown(f"**{title}**")
-        if df_win.empty:
-            st.info("Sem dados.")
-            continue
-        st.dataframe(df_win.sort_values(["dia", "status", "tipo"]), use_container_width=True, height=300)
-        csv = df_win.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "Baixar CSV",
-            data=csv,
-            file_name=f"dados_{title.replace(' ', '_').lower()}.csv",
-            mime="text/csv",
-            key=f"dl_periodo_compare_{title.replace(' ', '_').lower()}"
-        )
+render_raw_windows(window_dfs, window_keys)
 
 ## (Exportações removidas conforme solicitação)
 